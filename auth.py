@@ -0,0 +1,205 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import deque
+
+from config import (
+    SCRYPT_N, SCRYPT_R, SCRYPT_P,
+    LOGIN_WINDOW_SECONDS, LOGIN_MAX_ATTEMPTS_PER_USER, LOGIN_MAX_ATTEMPTS_PER_IP, TRUSTED_PROXIES,
+)
+
+HASH_SCHEME = "scrypt"
+# Peer address assumed when the server does not report one (a local connection)
+LOOPBACK_IP = "127.0.0.1"
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs roughly 128 * r * n bytes; leave headroom above hashlib's 32 MB default
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * r * n + 1024 * 1024, dklen=KEY_BYTES
+    )
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Hash a password as 'scrypt$n$r$p$salt$key' with a random salt."""
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p)
+    return "$".join([
+        HASH_SCHEME, str(n), str(r), str(p),
+        base64.b64encode(salt).decode("ascii"),
+        base64.b64encode(key).decode("ascii"),
+    ])
+
+
+def _parse_hash(stored_hash):
+    """Split a stored hash into (n, r, p, salt, key), or None for legacy plaintext values."""
+    parts = (stored_hash or "").split("$")
+    if len(parts) != 6 or parts[0] != HASH_SCHEME:
+        return None
+    try:
+        return (int(parts[1]), int(parts[2]), int(parts[3]),
+                base64.b64decode(parts[4]), base64.b64decode(parts[5]))
+    except ValueError:
+        return None
+
+
+def verify_password(password, stored_hash):
+    """Check a password against a stored scrypt hash (or a legacy plaintext password)."""
+    parsed = _parse_hash(stored_hash)
+    if parsed is None:
+        # Accounts created before hashing stored the password itself
+        return hmac.compare_digest((stored_hash or "").encode("utf-8"), password.encode("utf-8"))
+    n, r, p, salt, key = parsed
+    return hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+
+
+def needs_rehash(stored_hash, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Return True if a stored hash is plaintext or uses different cost parameters."""
+    parsed = _parse_hash(stored_hash)
+    return parsed is None or parsed[:3] != (n, r, p)
+
+
+# Verified against when the username does not exist, so unknown users cost the same time
+_DUMMY_HASH = None
+
+
+def dummy_verify(password):
+    """Spend the same hash work as a real verification, for unknown usernames."""
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_password("dummy-password")
+    verify_password(password, _DUMMY_HASH)
+    return False
+
+
+class SlidingWindowRateLimiter:
+    """
+    In-process sliding-window limiter: each key may make at most `max_attempts`
+    attempts within the last `window_seconds`.
+    """
+
+    def __init__(self, max_attempts, window_seconds, max_keys=10000):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, attempts, now):
+        while attempts and attempts[0] <= now - self.window_seconds:
+            attempts.popleft()
+
+    def _evict_expired(self, now):
+        for key in [key for key, attempts in self._attempts.items()
+                    if not attempts or attempts[-1] <= now - self.window_seconds]:
+            del self._attempts[key]
+
+    def hit(self, key):
+        """Record an attempt for `key`; return False if it exceeds the limit."""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                if len(self._attempts) >= self.max_keys:
+                    self._evict_expired(now)
+                attempts = self._attempts[key] = deque()
+            self._prune(attempts, now)
+            if len(attempts) >= self.max_attempts:
+                return False
+            attempts.append(now)
+            return True
+
+    def retry_after(self, key):
+        """Seconds until `key` may attempt again, or 0 if it is not limited."""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if not attempts:
+                return 0
+            self._prune(attempts, now)
+            if len(attempts) < self.max_attempts:
+                return 0
+            return max(0, int(attempts[0] + self.window_seconds - now) + 1)
+
+    def reset(self, key):
+        """Forget the attempts recorded for `key`."""
+        with self._lock:
+            self._attempts.pop(key, None)
+
+
+user_login_limiter = SlidingWindowRateLimiter(LOGIN_MAX_ATTEMPTS_PER_USER, LOGIN_WINDOW_SECONDS)
+ip_login_limiter = SlidingWindowRateLimiter(LOGIN_MAX_ATTEMPTS_PER_IP, LOGIN_WINDOW_SECONDS)
+
+
+def resolve_client_ip(peer_ip, forwarded_for=None, trusted_proxies=TRUSTED_PROXIES):
+    """
+    The address to rate-limit on. This is the socket peer, unless the peer is a
+    trusted proxy. In that case it is the rightmost X-Forwarded-For entry not
+    added by a trusted proxy, because entries further left are set by the client.
+    An unknown peer is treated as loopback, so a proxy on the same host can be
+    trusted. Returns None when the client address cannot be determined.
+    """
+    if (peer_ip or LOOPBACK_IP) in trusted_proxies and forwarded_for:
+        entries = [entry.strip() for entry in forwarded_for.split(",") if entry.strip()]
+        for entry in reversed(entries):
+            if entry not in trusted_proxies:
+                return entry
+    return peer_ip or None
+
+
+def allow_login_attempt(username, client_ip=None):
+    """
+    Record a login attempt; return False if the username or IP is over its limit.
+    Without a known client IP only the per-username limit applies, since a shared
+    bucket would let one client lock every user out.
+    """
+    if client_ip and not ip_login_limiter.hit(client_ip):
+        return False
+    return user_login_limiter.hit(username.lower())
+
+
+def login_retry_after(username, client_ip=None):
+    """Seconds until a rate-limited login for this username or IP may be retried."""
+    return max(
+        user_login_limiter.retry_after(username.lower()),
+        ip_login_limiter.retry_after(client_ip) if client_ip else 0,
+    )
+
+
+def reset_login_attempts(username):
+    """Clear the username's attempts after a successful login."""
+    user_login_limiter.reset(username.lower())
+
+
+def benchmark_scrypt(target_ms=100, r=SCRYPT_R, p=SCRYPT_P, samples=20):
+    """
+    Find the largest scrypt cost `n` whose p95 hash time stays under `target_ms`
+    on this machine. Prints the p95 for each candidate and returns the chosen n.
+    """
+    chosen = 2 ** 12
+    n = 2 ** 12
+    while n <= 2 ** 20:
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            _scrypt("benchmark-password", os.urandom(SALT_BYTES), n, r, p)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[int(0.95 * (len(timings) - 1))]
+        print(f"scrypt n=2**{n.bit_length() - 1} r={r} p={p}: p95 {p95:.1f} ms, {128 * r * n // (1024 * 1024)} MB")
+        if p95 > target_ms:
+            break
+        chosen = n
+        n *= 2
+    return chosen
+
+
+if __name__ == "__main__":
+    n = benchmark_scrypt()
+    print(f"Recommended: SCRYPT_N={n} SCRYPT_R={SCRYPT_R} SCRYPT_P={SCRYPT_P}")
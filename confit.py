@@ -10,3 +10,21 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Password hashing (scrypt) cost parameters; tune with `python auth.py`
+SCRYPT_N = int(os.getenv("SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.getenv("SCRYPT_R", 8))
+SCRYPT_P = int(os.getenv("SCRYPT_P", 1))
+
+# Login rate limits: attempts allowed per sliding window
+LOGIN_WINDOW_SECONDS = int(os.getenv("LOGIN_WINDOW_SECONDS", 60))
+LOGIN_MAX_ATTEMPTS_PER_USER = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_USER", 5))
+LOGIN_MAX_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", 20))
+# Comma-separated proxy addresses whose X-Forwarded-For header is trusted
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+# Longest side (in pixels) uploaded images are downscaled to before any OpenCV work
+WORKING_SIZE = int(os.getenv("WORKING_SIZE", 1024))
+
+# Shared model server (see model_server.py), e.g. http://127.0.0.1:8765; unset runs models in-process
+MODEL_SERVER_URL = os.getenv("MODEL_SERVER_URL")
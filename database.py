@@ -1,7 +1,16 @@
 import psycopg2
 import re
+import threading
+from contextlib import contextmanager
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 from config import DB_NAME, DB_USER, DB_PASSWORD, DB_HOST
+from recipe import parse_recipe, ingredient_keys, normalize_ingredient_term
+from nutrition import compute_recipe_nutrition, describe_nutrition
+from auth import (
+    hash_password, verify_password, needs_rehash, dummy_verify,
+    allow_login_attempt, reset_login_attempts,
+)
 
 # Connect to the database
 def get_db_connection():
@@ -13,6 +22,57 @@ def get_db_connection():
         password=DB_PASSWORD
     )
 
+_connection_pool = None
+_connection_pool_lock = threading.Lock()
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from a shared pool for hot paths such as login."""
+    global _connection_pool
+    if _connection_pool is None:
+        with _connection_pool_lock:
+            if _connection_pool is None:
+                _connection_pool = ThreadedConnectionPool(
+                    1, 10,
+                    host=DB_HOST,
+                    database=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD
+                )
+    conn = _connection_pool.getconn()
+    try:
+        with conn:
+            yield conn
+    finally:
+        _connection_pool.putconn(conn)
+
+def backfill_recipe_columns(cur):
+    """Fill the typed columns of recipes saved before those columns existed, from the stored recipe text."""
+    cur.execute("""
+        SELECT id, recipe, ingredients FROM user_recipes WHERE name IS NULL
+    """)
+    rows = cur.fetchall()
+    for recipe_id, recipe_text, ingredients in rows:
+        details = parse_recipe(recipe_text)
+        ingredient_list = details["ingredients"] or [
+            ingredient.strip() for ingredient in (ingredients or "").split(",") if ingredient.strip()
+        ]
+        # Same local estimate as newly saved recipes, so the calorie filter treats all rows alike
+        nutrition = compute_recipe_nutrition(details["ingredients"], details["servings"] or 1)
+        cur.execute("""
+            UPDATE user_recipes
+            SET name = %s, cooking_minutes = %s, ingredient_list = %s, ingredient_names = %s, steps = %s,
+                calories = %s, protein_g = %s, carbs_g = %s, fat_g = %s, nutrition_coverage = %s
+            WHERE id = %s
+        """, (
+            details["name"] or "Untitled recipe", details["cooking_minutes"], ingredient_list,
+            ingredient_keys(ingredient_list), details["steps"],
+            nutrition["calories"], nutrition["protein_g"], nutrition["carbs_g"], nutrition["fat_g"],
+            nutrition["coverage"], recipe_id
+        ))
+    if rows:
+        print(f"Backfilled typed columns for {len(rows)} saved recipe(s).")
+
 # Function to create the necessary tables if they do not exist
 def create_table():
     """Create the necessary tables for the application if they do not exist."""
@@ -33,6 +93,36 @@ def create_table():
                     );
                 """)
 
+                # Typed recipe fields, so listing and filtering never touch the recipe text
+                cur.execute("""
+                    ALTER TABLE user_recipes
+                        ADD COLUMN IF NOT EXISTS name VARCHAR(255),
+                        ADD COLUMN IF NOT EXISTS cooking_minutes INTEGER,
+                        ADD COLUMN IF NOT EXISTS ingredient_list TEXT[],
+                        ADD COLUMN IF NOT EXISTS ingredient_names TEXT[],
+                        ADD COLUMN IF NOT EXISTS steps TEXT[],
+                        ADD COLUMN IF NOT EXISTS calories REAL,
+                        ADD COLUMN IF NOT EXISTS protein_g REAL,
+                        ADD COLUMN IF NOT EXISTS carbs_g REAL,
+                        ADD COLUMN IF NOT EXISTS fat_g REAL,
+                        ADD COLUMN IF NOT EXISTS nutrition_coverage REAL;
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_user_recipes_username_name
+                        ON user_recipes (username, name);
+                    -- Cuisine is matched case-insensitively, so index lower(cuisine)
+                    DROP INDEX IF EXISTS idx_user_recipes_username_cuisine;
+                    CREATE INDEX IF NOT EXISTS idx_user_recipes_username_cuisine_lower
+                        ON user_recipes (username, lower(cuisine));
+                    CREATE INDEX IF NOT EXISTS idx_user_recipes_username_minutes
+                        ON user_recipes (username, cooking_minutes);
+                    CREATE INDEX IF NOT EXISTS idx_user_recipes_username_calories
+                        ON user_recipes (username, calories);
+                    CREATE INDEX IF NOT EXISTS idx_user_recipes_ingredient_names
+                        ON user_recipes USING GIN (ingredient_names);
+                """)
+                backfill_recipe_columns(cur)
+
                 # Create `users` table
                 cur.execute("""
                     CREATE TABLE IF NOT EXISTS users (
@@ -80,7 +170,7 @@ def register_user(username, phone_no, email, profile_picture, password, date_of_
                 cur.execute("""
                     INSERT INTO users (username, phone_no, email, profile_picture, password, date_of_birth)
                     VALUES (%s, %s, %s, %s, %s, %s)
-                """, (username, phone_no, email, profile_picture, password, date_of_birth))
+                """, (username, phone_no, email, profile_picture, hash_password(password), date_of_birth))
                 conn.commit()
                 return True
     except psycopg2.IntegrityError:
@@ -91,29 +181,63 @@ def register_user(username, phone_no, email, profile_picture, password, date_of_
         return False
 
 # Function to validate user login
-def validate_user(username, password):
-    """Validate user credentials for login."""
+def validate_user(username, password, client_ip=None):
+    """
+    Validate user credentials for login.
+
+    Attempts over the per-username or per-IP rate limit are rejected before the
+    database is queried or any hashing work is done. Passwords stored in plaintext
+    or with outdated scrypt parameters are rehashed after a successful login.
+    """
+    if not allow_login_attempt(username, client_ip):
+        print(f"Login rate limit exceeded for user {username!r}.")
+        return False
+
     try:
-        with get_db_connection() as conn:
+        with pooled_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
-                    SELECT * FROM users WHERE username = %s AND password = %s
-                """, (username, password))
-                return cur.fetchone() is not None
+                    SELECT password FROM users WHERE username = %s
+                """, (username,))
+                row = cur.fetchone()
+                if row is None:
+                    return dummy_verify(password)
+
+                stored_hash = row[0]
+                if not verify_password(password, stored_hash):
+                    return False
+
+                if needs_rehash(stored_hash):
+                    cur.execute("""
+                        UPDATE users SET password = %s WHERE username = %s AND password = %s
+                    """, (hash_password(password), username, stored_hash))
+                reset_login_attempts(username)
+                return True
     except Exception as e:
         print(f"An error occurred during login validation: {e}")
         return False
 
 # Insert recipe into the database
-def insert_recipe(username, recipe_name, cooking_time, cuisine, ingredients, nutritional_info, recipe_text):
-    """Insert a new recipe into the user_recipes table."""
+def insert_recipe(username, recipe_name, cooking_time, cuisine, ingredients, nutritional_info, recipe_text,
+                  cooking_minutes=None, ingredient_list=None, ingredient_names=None, steps=None, nutrition=None):
+    """Insert a new recipe into the user_recipes table, including its typed fields."""
+    nutrition = nutrition or {}
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
-                    INSERT INTO user_recipes (username, recipe, ingredients, cooking_time, nutritional_info, cuisine)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (username, recipe_text, ingredients, cooking_time, nutritional_info, cuisine))
+                    INSERT INTO user_recipes (
+                        username, recipe, ingredients, cooking_time, nutritional_info, cuisine,
+                        name, cooking_minutes, ingredient_list, ingredient_names, steps,
+                        calories, protein_g, carbs_g, fat_g, nutrition_coverage
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    username, recipe_text, ingredients, cooking_time, nutritional_info, cuisine,
+                    recipe_name or None, cooking_minutes, ingredient_list or [], ingredient_names or [], steps or [],
+                    nutrition.get("calories"), nutrition.get("protein_g"),
+                    nutrition.get("carbs_g"), nutrition.get("fat_g"), nutrition.get("coverage")
+                ))
                 conn.commit()
                 return True
     except psycopg2.IntegrityError:
@@ -148,23 +272,51 @@ def get_user_details(username):
         print(f"An error occurred while fetching user details: {e}")
         return None
     
-def get_user_recipes(username):
-    """Retrieve all recipes saved by a specific user."""
+def get_user_recipes(username, cuisine=None, max_minutes=None, ingredient=None, max_calories=None):
+    """
+    List a user's saved recipes from the typed columns only, optionally filtered
+    by cuisine, maximum cooking time in minutes, an ingredient in the recipe, or
+    maximum calories per serving.
+    """
+    conditions = [sql.SQL("username = %s")]
+    params = [username]
+    if cuisine:
+        conditions.append(sql.SQL("lower(cuisine) = lower(%s)"))
+        params.append(cuisine.strip())
+    if max_minutes is not None:
+        conditions.append(sql.SQL("cooking_minutes <= %s"))
+        params.append(max_minutes)
+    if ingredient:
+        conditions.append(sql.SQL("ingredient_names @> %s"))
+        params.append([normalize_ingredient_term(ingredient)])
+    if max_calories is not None:
+        conditions.append(sql.SQL("calories <= %s"))
+        params.append(max_calories)
+
+    query = sql.SQL("""
+        SELECT id, COALESCE(name, 'Untitled recipe'), cooking_minutes, cooking_time, cuisine,
+               calories, protein_g, carbs_g, fat_g, nutrition_coverage
+        FROM user_recipes WHERE {} ORDER BY id DESC
+    """).format(sql.SQL(" AND ").join(conditions))
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT recipe, ingredients, cooking_time, nutritional_info, cuisine 
-                    FROM user_recipes WHERE username = %s
-                """, (username,))
+                cur.execute(query, params)
                 recipes = cur.fetchall()
                 return [
                     {
-                        "name": recipe[0],
-                        "ingredients": recipe[1],
-                        "cooking_time": recipe[2],
-                        "nutritional_info": recipe[3],
+                        "id": recipe[0],
+                        "name": recipe[1],
+                        "cooking_minutes": recipe[2],
+                        "cooking_time": recipe[3],
                         "cuisine": recipe[4],
+                        "nutrition": {
+                            "calories": recipe[5],
+                            "protein_g": recipe[6],
+                            "carbs_g": recipe[7],
+                            "fat_g": recipe[8],
+                            "coverage": recipe[9],
+                        },
                     }
                     for recipe in recipes
                 ]
@@ -172,6 +324,34 @@ def get_user_recipes(username):
         print(f"An error occurred while fetching recipes: {e}")
         return []
 
+def get_recipe(username, recipe_id):
+    """Retrieve the full details of one saved recipe."""
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, COALESCE(name, 'Untitled recipe'), recipe, ingredients, ingredient_list, steps,
+                           cooking_time, nutritional_info, cuisine
+                    FROM user_recipes WHERE username = %s AND id = %s
+                """, (username, recipe_id))
+                recipe = cur.fetchone()
+                if recipe is None:
+                    return None
+                return {
+                    "id": recipe[0],
+                    "name": recipe[1],
+                    "recipe": recipe[2],
+                    "ingredients": recipe[3],
+                    "ingredient_list": recipe[4] or [],
+                    "steps": recipe[5] or [],
+                    "cooking_time": recipe[6],
+                    "nutritional_info": recipe[7],
+                    "cuisine": recipe[8],
+                }
+    except Exception as e:
+        print(f"An error occurred while fetching recipe: {e}")
+        return None
+
 
 # Call create_table when the script is run
 if __name__ == "__main__":
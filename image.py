@@ -3,10 +3,24 @@ import numpy as np
 import os
 import re
 import openai
-from PIL import Image
 import pytesseract
 import easyocr
 import torch
+import time
+import io
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+from config import MODEL_SERVER_URL, WORKING_SIZE
+
+# Fallback classifier input size and normalization (ImageNet statistics)
+CLASSIFIER_SIZE = (224, 224)
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+# Seconds to keep using in-process models after the model server fails to respond
+MODEL_SERVER_RETRY_SECONDS = 30
 
 # Defer PyTorch imports to runtime with error handling
 def load_ml_dependencies():
@@ -20,12 +34,22 @@ def load_ml_dependencies():
         return False, None
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, working_size=WORKING_SIZE, load_models=True):
         self.model = None
         self.image_processor = None
         self.labels = []
         self.ml_enabled = False
-        self.setup_ml()
+        self.working_size = working_size
+        self.classifier_size = CLASSIFIER_SIZE
+        self.last_preprocess_stats = {}
+        # Scratch buffers reused across images, keyed by pipeline stage
+        self._buffers = {}
+        self.set_normalization(IMAGENET_MEAN, IMAGENET_STD, 1 / 255.0)
+        self.ocr_reader = None
+        # Models and the pixel_values buffer are shared by every caller of this instance
+        self._model_lock = threading.Lock()
+        if load_models:
+            self.setup_ml()
 
     def setup_ml(self):
         success, modules = load_ml_dependencies()
@@ -38,6 +62,7 @@ class ImageProcessor:
                 self.model.eval()
                 self.labels = list(self.model.config.id2label.values())
                 self.ml_enabled = True
+                self.configure_from_image_processor(self.image_processor)
                 
                 # Define preprocessing pipeline
                 self.preprocess = transforms.Compose([
@@ -52,74 +77,220 @@ class ImageProcessor:
         else:
             self.ml_enabled = False
 
+    def set_normalization(self, mean, std, rescale_factor):
+        """Fold rescaling and mean/std normalization into one scale and offset per channel."""
+        mean = np.asarray(mean, dtype=np.float32).reshape(3, 1, 1)
+        std = np.asarray(std, dtype=np.float32).reshape(3, 1, 1)
+        self._pixel_scale = np.float32(rescale_factor) / std
+        self._pixel_offset = mean / std
+
+    def configure_from_image_processor(self, image_processor):
+        """Take input size and normalization from the Hugging Face image processor config."""
+        size = getattr(image_processor, "size", None)
+        if isinstance(size, dict):
+            height = size.get("height") or size.get("shortest_edge")
+            width = size.get("width") or size.get("shortest_edge")
+            if height and width:
+                self.classifier_size = (int(width), int(height))
+        elif isinstance(size, int):
+            self.classifier_size = (size, size)
+
+        if getattr(image_processor, "do_normalize", True):
+            mean = getattr(image_processor, "image_mean", None) or IMAGENET_MEAN
+            std = getattr(image_processor, "image_std", None) or IMAGENET_STD
+        else:
+            mean, std = [0.0, 0.0, 0.0], [1.0, 1.0, 1.0]
+        rescale_factor = 1 / 255.0
+        if getattr(image_processor, "do_rescale", True):
+            rescale_factor = getattr(image_processor, "rescale_factor", rescale_factor)
+        else:
+            rescale_factor = 1.0
+        self.set_normalization(mean, std, rescale_factor)
+
+    def _buffer(self, name, shape, dtype=np.uint8):
+        """Return a view of a reusable scratch buffer, growing it only when needed."""
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = np.empty(size, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer[:size].reshape(shape)
+
+    def downscale(self, image):
+        """Downscale an image so its longest side is at most `working_size`."""
+        height, width = image.shape[:2]
+        scale = self.working_size / float(max(height, width))
+        if scale >= 1.0:
+            return image
+        new_width = max(1, int(round(width * scale)))
+        new_height = max(1, int(round(height * scale)))
+        working = self._buffer("working", (new_height, new_width) + image.shape[2:])
+        cv2.resize(image, (new_width, new_height), dst=working, interpolation=cv2.INTER_AREA)
+        return working
+
     def preprocess_image(self, image):
+        """
+        Prepare an image for classification and OCR.
+
+        The image is downscaled once to the working resolution and every later
+        step writes into buffers shared across calls, so the returned arrays are
+        only valid until the next call. Returns the working-resolution image too,
+        which OCR engines that prefer colour input can use.
+        """
         try:
-            resized_image = cv2.resize(image, (224, 224))
-            gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            blurred_image = cv2.GaussianBlur(gray_image, (5, 5), 0)
-            thresh_image = cv2.adaptiveThreshold(
+            start = time.perf_counter()
+            working_image = self.downscale(image)
+            height, width = working_image.shape[:2]
+
+            resized_image = self._buffer("resized", self.classifier_size[::-1] + (3,))
+            cv2.resize(working_image, self.classifier_size, dst=resized_image, interpolation=cv2.INTER_AREA)
+
+            gray_image = self._buffer("gray", (height, width))
+            cv2.cvtColor(working_image, cv2.COLOR_BGR2GRAY, dst=gray_image)
+            blurred_image = self._buffer("blurred", (height, width))
+            cv2.GaussianBlur(gray_image, (5, 5), 0, dst=blurred_image)
+            thresh_image = self._buffer("thresh", (height, width))
+            cv2.adaptiveThreshold(
                 blurred_image, 255, 
                 cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY, 11, 2
+                cv2.THRESH_BINARY, 11, 2,
+                dst=thresh_image
             )
             kernel = np.ones((3, 3), np.uint8)
-            processed_image_for_ocr = cv2.morphologyEx(
+            processed_image_for_ocr = self._buffer("ocr", (height, width))
+            cv2.morphologyEx(
                 thresh_image, 
                 cv2.MORPH_CLOSE, 
-                kernel
+                kernel,
+                dst=processed_image_for_ocr
             )
-            return resized_image, processed_image_for_ocr
+
+            working_bytes = sum(
+                array.nbytes for array in (
+                    resized_image, gray_image, blurred_image, thresh_image, processed_image_for_ocr
+                )
+            )
+            if working_image is not image:
+                working_bytes += working_image.nbytes
+            self.last_preprocess_stats = {
+                "input_shape": image.shape,
+                "working_shape": working_image.shape,
+                "working_bytes": working_bytes,
+                "time_ms": (time.perf_counter() - start) * 1000,
+            }
+            return resized_image, processed_image_for_ocr, working_image
         except Exception as e:
             print(f"Error preprocessing image: {str(e)}")
-            return None, None
+            return None, None, None
+
+    def preprocess_images(self, images):
+        """
+        Batched variant of `preprocess_image`.
+
+        Returns a single (N, H, W, 3) array of classifier-sized images, a list of
+        OCR-ready images and a list of per-image stats. Unlike the single-image
+        path, the results are copied out of the shared buffers so they stay valid.
+        """
+        width, height = self.classifier_size
+        resized_batch = np.empty((len(images), height, width, 3), dtype=np.uint8)
+        ocr_images = []
+        stats = []
+        for index, image in enumerate(images):
+            resized_image, processed_image_for_ocr, _ = self.preprocess_image(image)
+            if resized_image is None:
+                resized_batch[index] = 0
+                ocr_images.append(None)
+                stats.append({})
+                continue
+            resized_batch[index] = resized_image
+            ocr_images.append(processed_image_for_ocr.copy())
+            stats.append(self.last_preprocess_stats)
+        return resized_batch, ocr_images, stats
 
-    def perform_ocr(self, processed_image_for_ocr, original_image):
+    def to_pixel_values(self, resized_images):
+        """Build the normalized (N, 3, H, W) classifier input straight from BGR uint8 arrays."""
+        count = len(resized_images)
+        width, height = self.classifier_size
+        pixel_values = self._buffer("pixel_values", (count, 3, height, width), np.float32)
+        for index, resized_image in enumerate(resized_images):
+            if resized_image.shape[:2] != (height, width):
+                resized_image = cv2.resize(resized_image, (width, height), interpolation=cv2.INTER_AREA)
+            # BGR -> RGB and HWC -> CHW are both views; the assignment does the cast
+            pixel_values[index] = resized_image[:, :, ::-1].transpose(2, 0, 1)
+        np.multiply(pixel_values, self._pixel_scale, out=pixel_values)
+        np.subtract(pixel_values, self._pixel_offset, out=pixel_values)
+        return torch.from_numpy(pixel_values)
+
+    def get_ocr_reader(self):
+        """Create the EasyOCR reader on first use and keep it for later images."""
+        if self.ocr_reader is None:
+            self.ocr_reader = easyocr.Reader(['en'])
+        return self.ocr_reader
+
+    def run_easyocr(self, image):
+        with self._model_lock:
+            easyocr_text = self.get_ocr_reader().readtext(image, detail=0)
+        return [self.clean_text(text) for text in easyocr_text]
+
+    def perform_ocr(self, processed_image_for_ocr, original_image, ocr_backend=None, raise_errors=False):
+        """
+        Run Tesseract locally and EasyOCR on `ocr_backend` (this processor by
+        default, or a ModelServerClient sharing models across processes).
+        With `raise_errors`, failures propagate instead of returning no text.
+        """
         try:
             # Tesseract OCR
             tesseract_text = pytesseract.image_to_string(processed_image_for_ocr)
             cleaned_tesseract_text = self.clean_text(tesseract_text)
 
             # EasyOCR
-            reader = easyocr.Reader(['en'])
-            easyocr_text = reader.readtext(original_image, detail=0)
-            cleaned_easyocr_text = [self.clean_text(text) for text in easyocr_text]
+            cleaned_easyocr_text = (ocr_backend or self).run_easyocr(original_image)
 
             return cleaned_tesseract_text, cleaned_easyocr_text
         except Exception as e:
             print(f"Error performing OCR: {str(e)}")
+            if raise_errors:
+                raise
             return "", []
 
     def classify_image(self, resized_image):
+        return self.classify_images([resized_image])[0]
+
+    def classify_images(self, resized_images, raise_errors=False):
+        """
+        Classify a batch of classifier-sized BGR images in a single forward pass.
+        With `raise_errors`, failures propagate instead of returning "unknown".
+        """
+        if len(resized_images) == 0:
+            return []
         if not self.ml_enabled:
-            return "unknown", 0.0
+            if raise_errors:
+                raise RuntimeError("Image classification model is not available")
+            return [("unknown", 0.0)] * len(resized_images)
 
         try:
-            # Convert BGR to RGB
-            rgb_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(rgb_image)
-            
-            # Process image
-            inputs = self.image_processor(pil_image, return_tensors="pt")
-            
-            with torch.no_grad():
-                outputs = self.model(**inputs)
+            with self._model_lock, torch.no_grad():
+                pixel_values = self.to_pixel_values(resized_images)
+                outputs = self.model(pixel_values=pixel_values)
 
-            predicted_idx = outputs.logits.argmax(-1).item()
             probs = torch.softmax(outputs.logits, dim=-1)
-            confidence = probs[0][predicted_idx].item()
-            predicted_label = self.model.config.id2label[predicted_idx]
-
-            return predicted_label, confidence
+            confidences, predicted_indices = probs.max(dim=-1)
+            return [
+                (self.model.config.id2label[idx], conf)
+                for idx, conf in zip(predicted_indices.tolist(), confidences.tolist())
+            ]
         except Exception as e:
             print(f"Error classifying image: {str(e)}")
-            return "unknown", 0.0
+            if raise_errors:
+                raise
+            return [("unknown", 0.0)] * len(resized_images)
 
     @staticmethod
     def clean_text(text):
         cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
         return cleaned_text.strip()
 
-    def identify_food_ingredients(self, text_list):
+    def identify_food_ingredients(self, text_list, raise_errors=False):
         ingredients = []
         base_prompt = """
         Analyze this text and determine if it contains a food ingredient name. 
@@ -148,13 +319,117 @@ class ImageProcessor:
                         ingredients.append(ingredient)
                 except Exception as e:
                     print(f"Error identifying ingredient from text: {str(e)}")
+                    if raise_errors:
+                        raise
                     continue
         
         return list(set(sorted(ingredients)))
 
-def process_uploaded_images(image_paths):
-    processor = ImageProcessor()
-    all_ingredients = []
+_local_processor = None
+_local_processor_lock = threading.Lock()
+
+def get_image_processor():
+    """Return the process-wide ImageProcessor, loading its models on first use."""
+    global _local_processor
+    if _local_processor is None:
+        with _local_processor_lock:
+            if _local_processor is None:
+                _local_processor = ImageProcessor()
+    return _local_processor
+
+_thread_state = threading.local()
+
+def get_preprocessor(working_size=WORKING_SIZE):
+    """
+    Return this thread's model-free ImageProcessor, so its preprocessing buffers
+    are reused across calls. ImageProcessor buffers are not safe to share between threads.
+    """
+    processor = getattr(_thread_state, "preprocessor", None)
+    if processor is None or processor.working_size != working_size:
+        processor = _thread_state.preprocessor = ImageProcessor(working_size=working_size, load_models=False)
+    return processor
+
+def encode_array(array):
+    """Serialize a NumPy array in .npy format for the model server."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+class ModelServerClient:
+    """
+    Thin client for model_server.py. Offers the same `run_easyocr` and
+    `classify_images` methods as ImageProcessor, and falls back to the
+    in-process models only when the server cannot be reached; errors the
+    server reports are raised so the caller can retry.
+    """
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._unavailable_until = 0.0
+
+    def _post(self, path, array):
+        request = urllib.request.Request(
+            f"{self.base_url}{path}",
+            data=encode_array(array),
+            headers={"Content-Type": "application/octet-stream"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def _call(self, path, array, local_method, **local_kwargs):
+        if time.monotonic() >= self._unavailable_until:
+            try:
+                return self._post(path, array)["result"]
+            except urllib.error.HTTPError as e:
+                # The server answered but failed (e.g. its classifier is unavailable); loading
+                # the models in this worker would not help, so let the caller retry later
+                try:
+                    message = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+                except Exception:
+                    message = e.reason
+                raise RuntimeError(f"Model server error on {path} ({e.code}): {message}") from e
+            except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+                print(f"Model server unavailable ({e}); using in-process models.")
+                self._unavailable_until = time.monotonic() + MODEL_SERVER_RETRY_SECONDS
+        return getattr(get_image_processor(), local_method)(array, **local_kwargs)
+
+    def run_easyocr(self, image):
+        return self._call("/ocr", image, "run_easyocr")
+
+    def classify_images(self, resized_images, raise_errors=False):
+        if len(resized_images) == 0:
+            return []
+        results = self._call(
+            "/classify", np.stack(resized_images), "classify_images", raise_errors=raise_errors
+        )
+        return [tuple(result) for result in results]
+
+_model_server_client = None
+
+def get_model_backend():
+    """Use the shared model server when MODEL_SERVER_URL is set, else in-process models."""
+    global _model_server_client
+    if MODEL_SERVER_URL:
+        if _model_server_client is None:
+            _model_server_client = ModelServerClient(MODEL_SERVER_URL)
+        return _model_server_client
+    return get_image_processor()
+
+def identify_ingredients_per_image(image_paths, working_size=WORKING_SIZE):
+    """
+    Identify ingredients in each image, returning a dict of image path to sorted
+    ingredient list. Images that could not be processed cleanly (unreadable file,
+    OCR, OpenAI or classification error) are left out, so callers can retry them.
+    """
+    backend = get_model_backend()
+    # Preprocessing needs no models, so it always runs here with this thread's buffers
+    processor = get_preprocessor(working_size)
+    ingredients_by_path = {}
+    # Images with no text-based ingredients, classified together after the loop
+    pending_paths = []
+    pending_classification = []
 
     for image_path in image_paths:
         try:
@@ -167,25 +442,36 @@ def process_uploaded_images(image_paths):
                 print(f"Error: Could not load image {image_path}")
                 continue
             
-            resized_image, processed_image_for_ocr = processor.preprocess_image(image)
+            resized_image, processed_image_for_ocr, working_image = processor.preprocess_image(image)
             if resized_image is None or processed_image_for_ocr is None:
                 continue
+            stats = processor.last_preprocess_stats
+            print(
+                f"Preprocessed {image_path}: {stats['input_shape'][1]}x{stats['input_shape'][0]} -> "
+                f"{stats['working_shape'][1]}x{stats['working_shape'][0]} in {stats['time_ms']:.1f} ms, "
+                f"{stats['working_bytes'] / 1024:.0f} KB working memory"
+            )
+            # Release the full-resolution original; everything below uses the working copy
+            del image
 
             cleaned_tesseract_text, cleaned_easyocr_text = processor.perform_ocr(
                 processed_image_for_ocr, 
-                image
+                working_image,
+                ocr_backend=backend,
+                raise_errors=True
             )
             
             identified_ingredients = processor.identify_food_ingredients(
-                cleaned_easyocr_text
+                cleaned_easyocr_text,
+                raise_errors=True
             )
-            all_ingredients.extend(identified_ingredients)
 
-            if not identified_ingredients:
-                print(f"No ingredients detected from text in {image_path}. Performing image classification...")
-                predicted_label, confidence = processor.classify_image(resized_image)
-                if confidence > 0.5 and predicted_label.lower() != "unknown":
-                    all_ingredients.append(predicted_label.lower())
+            if identified_ingredients:
+                ingredients_by_path[image_path] = identified_ingredients
+            else:
+                print(f"No ingredients detected from text in {image_path}. Queued for image classification...")
+                pending_paths.append(image_path)
+                pending_classification.append(resized_image.copy())
         
         except Exception as e:
             print(f"Error processing image {image_path}: {str(e)}")
@@ -198,11 +484,26 @@ def process_uploaded_images(image_paths):
             except Exception as e:
                 print(f"Error cleaning up temporary file {image_path}: {str(e)}")
 
+    try:
+        classifications = backend.classify_images(pending_classification, raise_errors=True)
+    except Exception as e:
+        print(f"Error classifying images: {str(e)}")
+        classifications = []
+    for image_path, (predicted_label, confidence) in zip(pending_paths, classifications):
+        ingredients_by_path[image_path] = []
+        if confidence > 0.5 and predicted_label.lower() != "unknown":
+            ingredients_by_path[image_path].append(predicted_label.lower())
+
     # Remove duplicates and sort
-    unique_ingredients = list(set(all_ingredients))
-    unique_ingredients.sort()
-    
-    return ", ".join([ing for ing in unique_ingredients if ing not in ["none", "unknown"]])
+    return {
+        image_path: sorted(set(ing for ing in ingredients if ing not in ["none", "unknown"]))
+        for image_path, ingredients in ingredients_by_path.items()
+    }
+
+def process_uploaded_images(image_paths, working_size=WORKING_SIZE):
+    ingredients_by_path = identify_ingredients_per_image(image_paths, working_size)
+    unique_ingredients = sorted(set(ing for ingredients in ingredients_by_path.values() for ing in ingredients))
+    return ", ".join(unique_ingredients)
 
 if __name__ == "__main__":
     image_paths = [r"C:\Users\amrut\Smart-Recipe-Generator_oct_2024\beetroot.jpg"]  # Example usage
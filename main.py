@@ -1,11 +1,15 @@
 import streamlit as st
 import os
 import base64
-from database import create_table, register_user, validate_user, insert_recipe, get_user_details, get_user_recipes
-from image import process_uploaded_images
+from database import create_table, register_user, validate_user, insert_recipe, get_user_details, get_user_recipes, get_recipe
+from auth import login_retry_after, resolve_client_ip
+from image import identify_ingredients_per_image
+from recipe import parse_recipe, format_recipe_markdown, ingredient_keys
+from nutrition import compute_recipe_nutrition, describe_nutrition
 from config import OPENAI_API_KEY
 import openai
 import time
+import hashlib
 from PIL import Image
 import io
 
@@ -73,20 +77,20 @@ def generate_recipe(ingredients, diet_preference):
     prompt = (
         f"Create a detailed recipe using these ingredients: {ingredients_str}. "
         f"Make sure the recipe is {diet_preference}. "
-        "Provide the following information in markdown format: "
-        "**Recipe Name:**\n"
-        "**Cooking Time:**\n"
-        "**Cuisine:**\n"
-        "**Ingredients:**\n"
-        "**Nutritional Information:**\n"
-        "**Instructions:**\n"
-        "Format your response clearly with bold text for subheadings."
+        "Respond with a single JSON object and nothing else, using these keys: "
+        '"name" (string), '
+        '"time_minutes" (integer, total cooking time), '
+        '"cuisine" (string), '
+        '"servings" (integer), '
+        '"ingredients" (list of strings, each with quantity and unit first, e.g. "200 g paneer"), '
+        '"steps" (list of strings, one instruction per item).'
     )
     try:
         response = openai.ChatCompletion.create(
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.8
+            temperature=0.8,
+            response_format={"type": "json_object"}
         )
         return response['choices'][0]['message']['content']
     except Exception as e:
@@ -100,48 +104,113 @@ def display_generated_recipe(recipe_text):
         st.markdown(recipe_text)
     else:
         st.error("Recipe generation failed. Please try again.")
-def extract_recipe_details(recipe_text):
-    """Extract structured data from generated recipe text."""
-    lines = recipe_text.split('\n')
-    recipe_details = {
-        "name": "",
-        "cooking_time": "",
-        "cuisine": "",
-        "nutritional_info": "",
-        "instructions": ""
+
+def store_generated_recipe(raw_recipe_text):
+    """Parse a generated recipe once and keep its details and display text in the session."""
+    st.session_state.recipe_saved = False
+    if not raw_recipe_text:
+        st.session_state.generated_recipe = None
+        st.session_state.generated_recipe_text = None
+        return None
+
+    recipe_details = parse_recipe(raw_recipe_text)
+    # Nutrition is estimated locally from the ingredient quantities rather than asked of the model
+    nutrition = compute_recipe_nutrition(recipe_details["ingredients"], recipe_details["servings"] or 1)
+    recipe_details["nutrition"] = nutrition
+    recipe_details["nutritional_info"] = describe_nutrition(nutrition)
+    if recipe_details["format"] == "json":
+        recipe_text = format_recipe_markdown(recipe_details)
+    else:
+        recipe_text = raw_recipe_text
+    st.session_state.generated_recipe = recipe_details
+    st.session_state.generated_recipe_text = recipe_text
+    return recipe_text
+
+def uploaded_file_hash(uploaded_file):
+    """Content hash of an uploaded file, cached per upload so reruns do not rehash it."""
+    file_id = getattr(uploaded_file, "file_id", None)
+    hashes = st.session_state.uploaded_file_hashes
+    if file_id and file_id in hashes:
+        return hashes[file_id]
+    digest = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    if file_id:
+        hashes[file_id] = digest
+    return digest
+
+def merged_ingredients():
+    """Comma-separated ingredients found across all uploaded files."""
+    return ", ".join(sorted(st.session_state.ingredient_counts))
+
+def add_file_ingredients(digest, ingredients):
+    """Record one file's ingredients and count them into the merged list."""
+    st.session_state.file_ingredients[digest] = ingredients
+    counts = st.session_state.ingredient_counts
+    for ingredient in ingredients:
+        counts[ingredient] = counts.get(ingredient, 0) + 1
+
+def drop_removed_uploads(uploaded_files_by_hash):
+    """Forget ingredients of files that are no longer uploaded; return True if any were dropped."""
+    file_ingredients = st.session_state.file_ingredients
+    counts = st.session_state.ingredient_counts
+    removed = [digest for digest in file_ingredients if digest not in uploaded_files_by_hash]
+    for digest in removed:
+        for ingredient in file_ingredients.pop(digest):
+            counts[ingredient] -= 1
+            if counts[ingredient] <= 0:
+                del counts[ingredient]
+
+    current_ids = {getattr(f, "file_id", None) for f in uploaded_files_by_hash.values()}
+    hashes = st.session_state.uploaded_file_hashes
+    for file_id in [file_id for file_id in hashes if file_id not in current_ids]:
+        del hashes[file_id]
+    return bool(removed)
+
+def identify_new_uploads(uploaded_files_by_hash):
+    """
+    Run ingredient identification only on files whose content has not been seen.
+    Files that fail are not recorded, so the next click retries them. Returns
+    the counts of processed and failed files.
+    """
+    new_files = {
+        digest: uploaded_file for digest, uploaded_file in uploaded_files_by_hash.items()
+        if digest not in st.session_state.file_ingredients
     }
-    current_section = None
-    nutritional_info_lines = []
-    instructions_lines = []
-
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        if line.startswith("**Recipe Name:**"):
-            # Extract only the recipe name part
-            recipe_details["name"] = line.split(" ")[-1].strip()
-            current_section = None
-        elif line.startswith("**Cooking Time:**"):
-            recipe_details["cooking_time"] = line.split("**Cooking Time:**")[-1].strip()
-            current_section = None
-        elif line.startswith("**Cuisine:**"):
-            recipe_details["cuisine"] = line.split("**Cuisine:**")[-1].strip()
-            current_section = None
-        elif line.startswith("**Nutritional Information:**"):
-            current_section = "nutritional_info"
-        elif line.startswith("**Instructions:**"):
-            current_section = "instructions"
-        elif current_section == "nutritional_info":
-            nutritional_info_lines.append(line)
-        elif current_section == "instructions":
-            instructions_lines.append(line)
-
-    recipe_details["nutritional_info"] = " ".join(nutritional_info_lines).strip()
-    recipe_details["instructions"] = "\n".join(instructions_lines).strip()
-    
-    return recipe_details
+    if not new_files:
+        return 0, 0
+
+    paths_by_hash = {}
+    for digest, uploaded_file in new_files.items():
+        temp_path = f"temp_{digest[:16]}_{uploaded_file.name}"
+        with open(temp_path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        paths_by_hash[digest] = temp_path
+
+    try:
+        ingredients_by_path = identify_ingredients_per_image(list(paths_by_hash.values()))
+        for digest, path in paths_by_hash.items():
+            if path in ingredients_by_path:
+                add_file_ingredients(digest, ingredients_by_path[path])
+    finally:
+        for path in paths_by_hash.values():
+            try:
+                os.remove(path)
+            except:
+                pass
+    failed_count = sum(1 for path in paths_by_hash.values() if path not in ingredients_by_path)
+    return len(new_files) - failed_count, failed_count
+
+def get_client_ip():
+    """Client IP for login rate limiting, from the connection's peer address and trusted proxy headers."""
+    # Read separately so a failed header lookup does not lose the peer address
+    try:
+        peer_ip = st.context.ip_address
+    except Exception:
+        peer_ip = None
+    try:
+        forwarded_for = st.context.headers.get("X-Forwarded-For")
+    except Exception:
+        forwarded_for = None
+    return resolve_client_ip(peer_ip, forwarded_for)
 
 def handle_profile_picture_display(user_details):
     """Handle profile picture display with proper error handling."""
@@ -198,6 +267,13 @@ def main():
         st.session_state.diet_preference = "Vegetarian"
     if "recipe_saved" not in st.session_state:
         st.session_state.recipe_saved = False
+    # Per-file identification results keyed by content hash, and how many files contain each ingredient
+    if "file_ingredients" not in st.session_state:
+        st.session_state.file_ingredients = {}
+    if "ingredient_counts" not in st.session_state:
+        st.session_state.ingredient_counts = {}
+    if "uploaded_file_hashes" not in st.session_state:
+        st.session_state.uploaded_file_hashes = {}
 
     # Landing Page
     if st.session_state.page == "landing":
@@ -222,12 +298,17 @@ def main():
         password = st.text_input("Password", type="password")
         
         if st.button("Login", key="login_submit"):
-            if validate_user(username, password):
+            client_ip = get_client_ip()
+            if validate_user(username, password, client_ip):
                 st.session_state.logged_in_user = username
                 st.session_state.page = "main"
                 st.success("Login successful!")
             else:
-                st.error("Invalid username or password.")
+                retry_after = login_retry_after(username, client_ip)
+                if retry_after:
+                    st.error(f"Too many login attempts. Please try again in {retry_after} seconds.")
+                else:
+                    st.error("Invalid username or password.")
         
         if st.button("Back to Home", key="login_home"):
             st.session_state.page = "landing"
@@ -276,6 +357,9 @@ def main():
             st.session_state.page = "landing"
             st.session_state.logged_in_user = None
             st.session_state.ingredients_identified = []
+            st.session_state.file_ingredients = {}
+            st.session_state.ingredient_counts = {}
+            st.session_state.uploaded_file_hashes = {}
 
         tab1, tab2 = st.tabs(["🧑‍🍳 Recipe Generation", "📚 Saved Recipes"])
 
@@ -293,47 +377,45 @@ def main():
                 accept_multiple_files=True
             )
 
+            uploaded_files_by_hash = {
+                uploaded_file_hash(uploaded_file): uploaded_file for uploaded_file in uploaded_files or []
+            }
+            if drop_removed_uploads(uploaded_files_by_hash):
+                st.session_state.ingredients_identified = merged_ingredients()
+
             if uploaded_files and st.button("Identify Ingredients", key="identify_ingredients"):
-                image_paths = []
-                for uploaded_file in uploaded_files:
-                    temp_path = f"temp_{uploaded_file.name}"
-                    with open(temp_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    image_paths.append(temp_path)
-
-                st.session_state.ingredients_identified = process_uploaded_images(image_paths)
-                st.success("Ingredients identified successfully!")
-
-                for path in image_paths:
-                    try:
-                        os.remove(path)
-                    except:
-                        pass
+                new_count, failed_count = identify_new_uploads(uploaded_files_by_hash)
+                st.session_state.ingredients_identified = merged_ingredients()
+                if new_count:
+                    st.success(f"Ingredients identified successfully! Processed {new_count} new image(s).")
+                if failed_count:
+                    st.warning(
+                        f"Could not process {failed_count} image(s). "
+                        "Click \"Identify Ingredients\" again to retry them."
+                    )
+                if not new_count and not failed_count:
+                    st.info("No new images to process.")
 
             if st.session_state.ingredients_identified:
                 st.write("Identified Ingredients:", st.session_state.ingredients_identified)
                 
                 if st.button("Generate Recipe", key="generate_recipe"):
-                    recipe_text = generate_recipe(
+                    recipe_text = store_generated_recipe(generate_recipe(
                         st.session_state.ingredients_identified,
                         st.session_state.diet_preference
-                    )
-                    st.session_state.generated_recipe_text = recipe_text
-                    st.session_state.recipe_saved = False
+                    ))
                     display_generated_recipe(recipe_text)
                 
                 if 'generated_recipe_text' in st.session_state and st.session_state.generated_recipe_text:
                     if st.button("Generate New Recipe", key="generate_new_recipe"):
-                        new_recipe_text = generate_recipe(
+                        new_recipe_text = store_generated_recipe(generate_recipe(
                             st.session_state.ingredients_identified,
                             st.session_state.diet_preference
-                        )
-                        st.session_state.generated_recipe_text = new_recipe_text
-                        st.session_state.recipe_saved = False
+                        ))
                         display_generated_recipe(new_recipe_text)
 
                     if not st.session_state.recipe_saved and st.button("Save Recipe", key="save_recipe"):
-                        recipe_details = extract_recipe_details(st.session_state.generated_recipe_text)
+                        recipe_details = st.session_state.generated_recipe
                         ingredients = format_ingredients(st.session_state.ingredients_identified)
                         
                         if insert_recipe(
@@ -343,7 +425,12 @@ def main():
                             recipe_details["cuisine"],
                             ingredients,
                             recipe_details["nutritional_info"],
-                            st.session_state.generated_recipe_text
+                            st.session_state.generated_recipe_text,
+                            cooking_minutes=recipe_details["cooking_minutes"],
+                            ingredient_list=recipe_details["ingredients"],
+                            ingredient_names=ingredient_keys(recipe_details["ingredients"]),
+                            steps=recipe_details["steps"],
+                            nutrition=recipe_details["nutrition"]
                         ):
                             st.success("Recipe saved successfully!")
                             st.session_state.recipe_saved = True
@@ -352,21 +439,61 @@ def main():
 
         with tab2:
             st.title("Saved Recipes")
-            saved_recipes = get_user_recipes(st.session_state.logged_in_user) or []
+            filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
+            with filter_col1:
+                cuisine_filter = st.text_input("Cuisine", key="filter_cuisine")
+            with filter_col2:
+                max_minutes_filter = st.number_input(
+                    "Max cooking time (minutes, 0 for any)", min_value=0, step=5, key="filter_max_minutes"
+                )
+            with filter_col3:
+                ingredient_filter = st.text_input("Contains ingredient", key="filter_ingredient")
+            with filter_col4:
+                max_calories_filter = st.number_input(
+                    "Max calories per serving (0 for any)", min_value=0, step=50, key="filter_max_calories"
+                )
+
+            saved_recipes = get_user_recipes(
+                st.session_state.logged_in_user,
+                cuisine=cuisine_filter.strip() or None,
+                max_minutes=int(max_minutes_filter) or None,
+                ingredient=ingredient_filter.strip() or None,
+                max_calories=int(max_calories_filter) or None
+            ) or []
             
             if not saved_recipes:
-                st.info("You have no saved recipes.")
+                st.info("You have no saved recipes matching these filters.")
             else:
-                recipe_names = [recipe["name"] for recipe in saved_recipes]
-                selected_recipe_name = st.selectbox("Select a recipe to view details", recipe_names)
-                if selected_recipe_name:
-                    selected_recipe = next((r for r in saved_recipes if r["name"] == selected_recipe_name), None)
+                recipe_labels = {}
+                for recipe in saved_recipes:
+                    nutrition = recipe["nutrition"]
+                    label = recipe["name"]
+                    if nutrition["calories"] is not None:
+                        partial = nutrition["coverage"] is not None and nutrition["coverage"] < 1
+                        label += f" ({nutrition['calories']:g} kcal{', partial estimate' if partial else ''})"
+                    recipe_labels[recipe["id"]] = label
+                selected_recipe_id = st.selectbox(
+                    "Select a recipe to view details",
+                    list(recipe_labels),
+                    format_func=lambda recipe_id: recipe_labels[recipe_id]
+                )
+                if selected_recipe_id:
+                    selected_recipe = get_recipe(st.session_state.logged_in_user, selected_recipe_id)
                     if selected_recipe:
                         st.subheader(selected_recipe["name"])
                         st.write(f"**Cooking Time:** {selected_recipe['cooking_time']}")
                         st.write(f"**Cuisine:** {selected_recipe['cuisine']}")
-                        st.write(f"**Ingredients:**\n{selected_recipe['ingredients']}")
+                        if selected_recipe["ingredient_list"]:
+                            st.write("**Ingredients:**")
+                            st.markdown("\n".join(f"- {line}" for line in selected_recipe["ingredient_list"]))
+                        else:
+                            st.write(f"**Ingredients:**\n{selected_recipe['ingredients']}")
                         st.write(f"**Nutritional Info:**\n{selected_recipe['nutritional_info']}")
+                        if selected_recipe["steps"]:
+                            st.write("**Instructions:**")
+                            st.markdown("\n".join(
+                                f"{index}. {step}" for index, step in enumerate(selected_recipe["steps"], start=1)
+                            ))
                        
                     else:
                         st.warning("Selected recipe not found.")
@@ -0,0 +1,143 @@
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from image import get_image_processor
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Largest number of images classified in one forward pass
+MAX_BATCH_SIZE = 32
+# How long the first request in a batch waits for others to join it
+MAX_BATCH_WAIT_MS = 10
+
+
+class ClassificationBatcher:
+    """
+    Collects classification requests from concurrent clients and runs them
+    through the model together, up to MAX_BATCH_SIZE images per forward pass.
+    """
+
+    def __init__(self, processor, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.processor = processor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._requests = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def classify(self, images):
+        """Queue a (N, H, W, 3) batch of images and wait for its results."""
+        request = {"images": images, "done": threading.Event(), "results": None, "error": None}
+        self._requests.put(request)
+        request["done"].wait()
+        if request["error"] is not None:
+            raise RuntimeError(request["error"])
+        return request["results"]
+
+    def _collect(self):
+        batch = [self._requests.get()]
+        count = len(batch[0]["images"])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            count += len(request["images"])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            images = [image for request in batch for image in request["images"]]
+            try:
+                results = self.processor.classify_images(images, raise_errors=True)
+            except Exception as e:
+                # Fail every request in the batch so clients can retry rather than cache "unknown"
+                print(f"Error classifying batch: {str(e)}")
+                for request in batch:
+                    request["error"] = str(e)
+                    request["done"].set()
+                continue
+            start = 0
+            for request in batch:
+                end = start + len(request["images"])
+                request["results"] = results[start:end]
+                request["done"].set()
+                start = end
+
+
+class ModelRequestHandler(BaseHTTPRequestHandler):
+    """Serves /classify and /ocr on .npy request bodies, and /health."""
+
+    processor = None
+    batcher = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_array(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return np.load(io.BytesIO(self.rfile.read(length)), allow_pickle=False)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "ml_enabled": self.processor.ml_enabled})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            if self.path == "/classify":
+                images = self._read_array()
+                if images.ndim != 4 or images.shape[-1] != 3:
+                    self._send_json(400, {"error": "expected an (N, H, W, 3) uint8 array"})
+                    return
+                self._send_json(200, {"result": self.batcher.classify(images.astype(np.uint8, copy=False))})
+            elif self.path == "/ocr":
+                self._send_json(200, {"result": self.processor.run_easyocr(self._read_array())})
+            else:
+                self._send_json(404, {"error": "not found"})
+        except Exception as e:
+            print(f"Error handling {self.path}: {str(e)}")
+            self._send_json(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Load the models once and serve them to every UI worker on this node."""
+    processor = get_image_processor()
+    processor.get_ocr_reader()
+    ModelRequestHandler.processor = processor
+    ModelRequestHandler.batcher = ClassificationBatcher(processor)
+    server = ThreadingHTTPServer((host, port), ModelRequestHandler)
+    print(f"Model server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the image classification and OCR models to UI workers.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -0,0 +1,147 @@
+import csv
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from recipe import NUTRITION_FIELDS, parse_ingredient, format_nutrition
+
+NUTRITION_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nutrition_facts.csv")
+
+# Grams per unit for weight measures and for loose measures with a fixed weight
+MASS_UNITS_G = {"g": 1.0, "kg": 1000.0, "mg": 0.001, "oz": 28.35, "lb": 453.6,
+                "pinch": 0.4, "dash": 0.6, "handful": 30.0, "can": 400.0}
+# Millilitres per unit for volume measures
+VOLUME_UNITS_ML = {"ml": 1.0, "l": 1000.0, "cup": 240.0, "tbsp": 15.0, "tsp": 5.0}
+# Multiples of the ingredient's typical piece weight for counted ingredients
+PIECE_UNITS = {None: 1.0, "piece": 1.0, "small": 0.75, "medium": 1.0, "large": 1.25}
+# Weight assumed for one piece when the table does not list one
+DEFAULT_PIECE_G = 100.0
+# Share of measured ingredient lines that must be in the table for totals to be reported
+MIN_NUTRITION_COVERAGE = 0.6
+
+
+class NutritionTable:
+    """Per-100 g nutrition values for canonical ingredients, held in NumPy arrays."""
+
+    def __init__(self, names, values, g_per_ml, piece_g):
+        self.names = names
+        self.index = {name: row for row, name in enumerate(names)}
+        self.values = values
+        self.g_per_ml = g_per_ml
+        self.piece_g = piece_g
+        self._lookup_cache = {}
+
+    @classmethod
+    def from_csv(cls, path=NUTRITION_TABLE_PATH):
+        """Load the table from a CSV file, skipping '#' comment lines."""
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(line for line in f if not line.startswith("#")))
+        names = [row["name"].strip().lower() for row in rows]
+        values = np.array([[float(row[field]) for field in NUTRITION_FIELDS]
+                           for row in rows], dtype=np.float64)
+        g_per_ml = np.array([float(row["g_per_ml"] or 1.0) for row in rows], dtype=np.float64)
+        piece_g = np.array([float(row["piece_g"] or DEFAULT_PIECE_G) for row in rows], dtype=np.float64)
+        return cls(names, values, g_per_ml, piece_g)
+
+    @staticmethod
+    def _singular_forms(name):
+        forms = [name]
+        if name.endswith("ies"):
+            forms += [name[:-3] + "y", name[:-2]]
+        if name.endswith("es"):
+            forms.append(name[:-2])
+        if name.endswith("s"):
+            forms.append(name[:-1])
+        return forms
+
+    def lookup(self, name):
+        """Return the table row for an ingredient name, or -1 if it is not known."""
+        if name in self._lookup_cache:
+            return self._lookup_cache[name]
+        words = name.split()
+        row = -1
+        if "cooked" in words:
+            # Table rows are raw/dry weights, so a cooked quantity would be over-counted
+            self._lookup_cache[name] = row
+            return row
+        # Whole name first, then shorter suffixes ("red onion" -> "onion"). Only the
+        # trailing head noun is tried, so modifiers ("chicken stock") never match
+        candidates = [" ".join(words[start:]) for start in range(len(words))]
+        for candidate in candidates:
+            for form in self._singular_forms(candidate):
+                if form in self.index:
+                    row = self.index[form]
+                    break
+            if row != -1:
+                break
+        self._lookup_cache[name] = row
+        return row
+
+    def recipe_totals(self, ingredient_lines, servings=1):
+        """
+        Compute nutrition per serving for a list of ingredient lines.
+
+        Returns a dict keyed by NUTRITION_FIELDS plus "coverage", the share of
+        measured lines (those stating a quantity or unit) found in the table.
+        Nutrition values are None when coverage is below MIN_NUTRITION_COVERAGE,
+        so a recipe whose main ingredients are unknown is not under-counted.
+        """
+        rows, quantities, mass_g, volume_ml, pieces = [], [], [], [], []
+        measured_lines = 0
+        for line in ingredient_lines:
+            quantity, unit, name = parse_ingredient(line)
+            if quantity is None and unit is None:
+                # Unmeasured lines such as 'salt to taste' add little and are not counted
+                continue
+            measured_lines += 1
+            row = self.lookup(name)
+            if row == -1:
+                continue
+            rows.append(row)
+            quantities.append(1.0 if quantity is None else quantity)
+            mass_g.append(MASS_UNITS_G.get(unit, 0.0))
+            volume_ml.append(VOLUME_UNITS_ML.get(unit, 0.0))
+            pieces.append(PIECE_UNITS.get(unit, 0.0))
+
+        result = {field: None for field in NUTRITION_FIELDS}
+        result["coverage"] = round(len(rows) / measured_lines, 2) if measured_lines else None
+        if not rows or result["coverage"] < MIN_NUTRITION_COVERAGE:
+            return result
+
+        rows = np.array(rows, dtype=np.intp)
+        # Exactly one of mass_g, volume_ml and pieces is non-zero for each line
+        grams = np.array(quantities) * (
+            np.array(mass_g)
+            + np.array(volume_ml) * self.g_per_ml[rows]
+            + np.array(pieces) * self.piece_g[rows]
+        )
+        totals = (grams / 100.0) @ self.values[rows] / max(servings or 1, 1)
+        result.update({field: round(float(value), 1) for field, value in zip(NUTRITION_FIELDS, totals)})
+        return result
+
+
+def describe_nutrition(nutrition):
+    """Display text for an estimate from recipe_totals, saying when it is partial or missing."""
+    if nutrition.get("calories") is None:
+        return "Not enough known ingredients to estimate nutrition."
+    text = f"{format_nutrition(nutrition)} per serving (estimated)"
+    coverage = nutrition.get("coverage")
+    if coverage is not None and coverage < 1:
+        text += f"; partial estimate, {coverage:.0%} of measured ingredients recognised"
+    return text
+
+
+@lru_cache(maxsize=1)
+def get_nutrition_table():
+    """Load the nutrition table once per process."""
+    return NutritionTable.from_csv()
+
+
+def compute_recipe_nutrition(ingredient_lines, servings=1):
+    """Estimate per-serving nutrition for ingredient lines such as '200 g paneer'."""
+    try:
+        return get_nutrition_table().recipe_totals(ingredient_lines, servings)
+    except Exception as e:
+        print(f"Error computing nutrition: {e}")
+        return dict({field: None for field in NUTRITION_FIELDS}, coverage=None)
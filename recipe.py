@@ -0,0 +1,335 @@
+import json
+import re
+
+# Numeric nutrition fields stored alongside each saved recipe
+NUTRITION_FIELDS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+# Markdown section headings produced by the recipe prompt, mapped to detail keys
+SECTION_HEADINGS = {
+    "recipe name": "name",
+    "cooking time": "cooking_time",
+    "cuisine": "cuisine",
+    "servings": "servings",
+    "ingredients": "ingredients",
+    "nutritional information": "nutrition",
+    "nutrition": "nutrition",
+    "instructions": "steps",
+    "steps": "steps",
+}
+
+HEADING_PATTERN = re.compile(
+    r"^(?:#+\s*)?\**\s*(" + "|".join(sorted(SECTION_HEADINGS, key=len, reverse=True)) + r")\s*(?::\s*\**|\**\s*:|\**\s*$)\s*(.*)$",
+    re.IGNORECASE,
+)
+LIST_MARKER_PATTERN = re.compile(r"^(?:[-*•]|\d+[.)])\s+")
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+HOURS_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:hours?|hrs?|h)\b", re.IGNORECASE)
+MINUTES_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:minutes?|mins?|m)\b", re.IGNORECASE)
+QUANTITY_PATTERN = re.compile(
+    r"^(\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?|[¼½¾⅓⅔])(?:\s*(?:-|to)\s*(\d+(?:\.\d+)?))?\s*"
+)
+UNICODE_FRACTIONS = {"¼": 0.25, "½": 0.5, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+# Unit spellings mapped to the canonical unit names understood by the nutrition engine
+UNIT_ALIASES = {
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g",
+    "kg": "kg", "kgs": "kg", "kilogram": "kg", "kilograms": "kg", "mg": "mg",
+    "ml": "ml", "l": "l", "litre": "l", "litres": "l", "liter": "l", "liters": "l",
+    "cup": "cup", "cups": "cup", "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "oz": "oz", "ounce": "oz", "ounces": "oz", "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "pinch": "pinch", "dash": "dash", "handful": "handful",
+    "piece": "piece", "pieces": "piece", "clove": "piece", "cloves": "piece",
+    "slice": "piece", "slices": "piece", "can": "can", "cans": "can",
+    "small": "small", "medium": "medium", "large": "large",
+}
+UNIT_WORDS = set(UNIT_ALIASES) | {"of"}
+NUTRITION_LABELS = {
+    "calories": re.compile(r"calor|kcal|energy", re.IGNORECASE),
+    "protein_g": re.compile(r"protein", re.IGNORECASE),
+    "carbs_g": re.compile(r"carb", re.IGNORECASE),
+    "fat_g": re.compile(r"\bfats?\b", re.IGNORECASE),
+}
+
+
+def empty_recipe_details():
+    """Return a recipe details dict with every field present."""
+    return {
+        "format": "markdown",
+        "name": "",
+        "cooking_time": "",
+        "cooking_minutes": None,
+        "cuisine": "",
+        "servings": None,
+        "ingredients": [],
+        "nutrition": {field: None for field in NUTRITION_FIELDS},
+        "nutritional_info": "",
+        "steps": [],
+        "instructions": "",
+    }
+
+
+def _parse_quantity(text):
+    """Convert '2', '1.5', '1/2', '1 1/2' or a unicode fraction to a float."""
+    if text in UNICODE_FRACTIONS:
+        return UNICODE_FRACTIONS[text]
+    total = 0.0
+    for part in text.split():
+        if "/" in part:
+            numerator, denominator = part.split("/")
+            total += float(numerator) / float(denominator) if float(denominator) else 0.0
+        else:
+            total += float(part)
+    return total
+
+
+def parse_ingredient(line):
+    """
+    Split an ingredient line such as '1 1/2 cups basmati rice, rinsed' into
+    (quantity, unit, name), e.g. (1.5, 'cup', 'basmati rice'). Quantity and unit
+    are None when the line does not state them.
+    """
+    text = re.sub(r"\([^)]*\)", " ", line.lower()).split(",")[0].strip()
+    quantity = None
+    match = QUANTITY_PATTERN.match(text)
+    if match:
+        quantity = _parse_quantity(match.group(1))
+        if match.group(2):
+            # Ranges such as '2-3 tomatoes' use the midpoint
+            quantity = (quantity + float(match.group(2))) / 2
+        text = text[match.end():]
+    text = re.sub(r"\b(?:to taste|as needed|as required|for garnish(?:ing)?)\b", " ", text)
+
+    unit = None
+    words = text.split()
+    while words and words[0].rstrip(".") in UNIT_WORDS:
+        word = words.pop(0).rstrip(".")
+        if unit is None and word in UNIT_ALIASES:
+            unit = UNIT_ALIASES[word]
+    return quantity, unit, " ".join(words).strip(" .-*")
+
+
+def ingredient_name(line):
+    """Reduce an ingredient line such as '200 g paneer, cubed' to its name ('paneer')."""
+    return parse_ingredient(line)[2]
+
+
+def normalize_ingredient_word(word):
+    """Reduce a word to a crude singular form so 'tomatoes'/'tomato' and 'chillies'/'chilli' compare equal."""
+    word = word.lower()
+    if word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "i"
+    elif word.endswith(("oes", "ses", "xes", "ches", "shes")) and len(word) > 4:
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        word = word[:-1]
+    if word.endswith("y") and len(word) > 3:
+        word = word[:-1] + "i"
+    return word
+
+
+def normalize_ingredient_term(text):
+    """Normalize an ingredient name or search term word by word."""
+    return " ".join(normalize_ingredient_word(word) for word in re.findall(r"[a-z]+", text.lower()))
+
+
+def ingredient_keys(ingredient_lines):
+    """
+    Searchable keys for a recipe's ingredients: each normalized full name plus
+    its individual words, so searching 'onion' finds '2 chopped onions'.
+    """
+    keys = set()
+    for line in ingredient_lines:
+        name = normalize_ingredient_term(ingredient_name(line))
+        if name:
+            keys.add(name)
+            keys.update(name.split())
+    return sorted(keys)
+
+
+def to_number(value):
+    """Convert a JSON value or a string such as '450 kcal' to a float, or None."""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER_PATTERN.search(str(value))
+    return float(match.group()) if match else None
+
+
+def parse_minutes(text):
+    """Parse a cooking time such as '1 hour 15 minutes' into whole minutes."""
+    if text is None:
+        return None
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return int(round(text))
+    text = str(text)
+    hours = HOURS_PATTERN.search(text)
+    minutes = MINUTES_PATTERN.search(text)
+    if hours or minutes:
+        total = 0.0
+        if hours:
+            total += float(hours.group(1)) * 60
+        if minutes:
+            total += float(minutes.group(1))
+        return int(round(total))
+    number = to_number(text)
+    return int(round(number)) if number is not None else None
+
+
+def format_nutrition(nutrition):
+    """Render numeric nutrition fields as a short display string."""
+    parts = []
+    labels = (("calories", "Calories", " kcal"), ("protein_g", "Protein", " g"),
+              ("carbs_g", "Carbohydrates", " g"), ("fat_g", "Fat", " g"))
+    for field, label, unit in labels:
+        value = nutrition.get(field)
+        if value is not None:
+            parts.append(f"{label}: {value:g}{unit}")
+    return ", ".join(parts)
+
+
+def _as_text_list(value):
+    """Normalize a JSON list (of strings or small objects) into a list of strings."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [line for line in value.split("\n")]
+    items = []
+    for item in value:
+        if isinstance(item, dict):
+            item = " ".join(str(part) for part in item.values() if part not in (None, ""))
+        item = LIST_MARKER_PATTERN.sub("", str(item).strip())
+        if item:
+            items.append(item)
+    return items
+
+
+def parse_recipe_json(recipe_text):
+    """Parse the structured JSON recipe response; return None if it is not JSON."""
+    if not recipe_text:
+        return None
+    start = recipe_text.find("{")
+    end = recipe_text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(recipe_text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    details = empty_recipe_details()
+    details["format"] = "json"
+    details["name"] = str(data.get("name") or data.get("recipe_name") or "").strip()
+    details["cuisine"] = str(data.get("cuisine") or "").strip()
+    servings = to_number(data.get("servings"))
+    details["servings"] = int(servings) if servings else None
+
+    minutes = data.get("time_minutes", data.get("cooking_time_minutes"))
+    if minutes is None:
+        minutes = parse_minutes(data.get("cooking_time"))
+    else:
+        minutes = parse_minutes(minutes)
+    details["cooking_minutes"] = minutes
+    details["cooking_time"] = f"{minutes} minutes" if minutes is not None else str(data.get("cooking_time") or "")
+
+    details["ingredients"] = _as_text_list(data.get("ingredients"))
+    details["steps"] = _as_text_list(data.get("steps") or data.get("instructions"))
+    details["instructions"] = "\n".join(details["steps"])
+
+    nutrition = data.get("nutrition") or {}
+    if isinstance(nutrition, dict):
+        for field in NUTRITION_FIELDS:
+            value = nutrition.get(field)
+            if value is None:
+                # Accept unsuffixed keys such as "protein" or "carbs"
+                value = nutrition.get(field.split("_")[0])
+            details["nutrition"][field] = to_number(value)
+    details["nutritional_info"] = format_nutrition(details["nutrition"])
+    return details
+
+
+def _parse_nutrition_lines(lines, nutrition):
+    """Fill numeric nutrition fields from free-form lines such as 'Protein: 20g'."""
+    for line in lines:
+        for part in re.split(r"[,;|]", line):
+            for field, label in NUTRITION_LABELS.items():
+                if nutrition[field] is None and label.search(part):
+                    nutrition[field] = to_number(part)
+
+
+def extract_recipe_details(recipe_text):
+    """Extract structured data from a markdown recipe in a single pass over its lines."""
+    details = empty_recipe_details()
+    sections = {"ingredients": [], "nutrition": [], "steps": []}
+    current_section = None
+    # Scalar heading whose value is on the following line, e.g. "**Recipe Name:**\nPaneer Tikka"
+    pending_scalar = None
+
+    for line in recipe_text.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            key = SECTION_HEADINGS[heading.group(1).lower()]
+            remainder = heading.group(2).strip().strip("*").strip()
+            pending_scalar = None
+            if key in sections:
+                current_section = key
+                if remainder:
+                    sections[key].append(remainder)
+            else:
+                details[key] = remainder
+                current_section = None
+                if not remainder:
+                    pending_scalar = key
+        elif pending_scalar:
+            details[pending_scalar] = LIST_MARKER_PATTERN.sub("", line).strip().strip("*").strip()
+            pending_scalar = None
+        elif current_section:
+            item = LIST_MARKER_PATTERN.sub("", line).strip()
+            if item:
+                sections[current_section].append(item)
+
+    details["cooking_minutes"] = parse_minutes(details["cooking_time"]) if details["cooking_time"] else None
+    servings = to_number(details["servings"])
+    details["servings"] = int(servings) if servings else None
+    details["ingredients"] = sections["ingredients"]
+    details["steps"] = sections["steps"]
+    details["instructions"] = "\n".join(sections["steps"])
+    details["nutritional_info"] = " ".join(sections["nutrition"]).strip()
+    _parse_nutrition_lines(sections["nutrition"], details["nutrition"])
+    return details
+
+
+def parse_recipe(recipe_text):
+    """Parse a generated recipe, trying structured JSON first and markdown second."""
+    details = parse_recipe_json(recipe_text)
+    if details is None:
+        details = extract_recipe_details(recipe_text or "")
+    return details
+
+
+def format_recipe_markdown(details):
+    """Render parsed recipe details as markdown for display and storage."""
+    lines = [f"**Recipe Name:** {details['name']}"]
+    if details["cooking_time"]:
+        lines.append(f"**Cooking Time:** {details['cooking_time']}")
+    if details["cuisine"]:
+        lines.append(f"**Cuisine:** {details['cuisine']}")
+    if details["servings"]:
+        lines.append(f"**Servings:** {details['servings']}")
+    lines.append("")
+    lines.append("**Ingredients:**")
+    lines.extend(f"- {ingredient}" for ingredient in details["ingredients"])
+    if details["nutritional_info"]:
+        lines.append("")
+        lines.append("**Nutritional Information:**")
+        lines.append(details["nutritional_info"])
+    lines.append("")
+    lines.append("**Instructions:**")
+    lines.extend(f"{index}. {step}" for index, step in enumerate(details["steps"], start=1))
+    return "\n".join(lines)